@@ -230,12 +230,11 @@ if st.button("🚀 Compute Matches", type="primary", use_container_width=True):
     with col3:
         show_top_n = st.number_input("Show top N rows", min_value=10, max_value=len(results), value=min(100, len(results)), step=10, key="show_n")
     
-    # Apply filters
-    filtered = results.copy()
+    # Apply filters (one combined mask; Method_Used is categorical, scores are float32)
+    mask = results["Computed_Score"].to_numpy() >= min_score_filter
     if filter_method != "All":
-        filtered = filtered[filtered["Method_Used"] == filter_method]
-    filtered = filtered[filtered["Computed_Score"] >= min_score_filter]
-    filtered = filtered.head(show_top_n)
+        mask &= (results["Method_Used"] == filter_method).to_numpy()
+    filtered = results[mask].head(show_top_n)
     
     st.dataframe(filtered, use_container_width=True, height=400)
     
@@ -1,19 +1,30 @@
 """Hybrid requirement-matching logic for the MR400 Pro tracing tool."""
 from __future__ import annotations
 
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
+import hashlib
 import json
 import math
 import os
 from pathlib import Path
+import re
+import sqlite3
+import threading
 from typing import Iterable, Literal, Sequence
+import warnings
 
 import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from openai import OpenAI
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from openai import AsyncOpenAI, RateLimitError
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.pipeline import Pipeline, make_pipeline
+import xlsxwriter
 
 # Make sentence-transformers optional (only needed for SBERT fallback)
 try:
@@ -23,8 +34,28 @@ except ImportError:
     SBERT_AVAILABLE = False
     SentenceTransformer = None
 
+# Make faiss optional (only needed for ANN candidate search on large parent sets)
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+    faiss = None
+
+# Make numba optional (only used to JIT the fused fusion + top-K kernel)
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 load_dotenv()
 
+RULE_SCORE = 0.85  # score assigned when child and parent share a lexicon group
+
+METHOD_FUSION, METHOD_SBERT, METHOD_TFIDF, METHOD_NA = range(4)
+METHOD_LABELS = np.array(["Fusion", "SBERT", "TF-IDF", "N/A"], dtype=object)
+
 DEFAULT_STOP_PHRASES = [
     "the user shall be able to",
     "the user shall",
@@ -49,10 +80,86 @@ class MatchingConfig:
     ngram_range: tuple[int, int] = (1, 3)
     stop_phrases: Sequence[str] = tuple(DEFAULT_STOP_PHRASES)
     rules_enabled: bool = True
-    lexical_max_features: int | None = None
+    # Number of hash buckets for TF-IDF features (not a vocabulary cap; fewer buckets means more collisions)
+    lexical_hash_features: int = 2**18
     lexical_stop_phrases: Sequence[str] = tuple(DEFAULT_STOP_PHRASES)
     sbert_model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
     lexicon_path: str = "domain_lexicon.json"
+    # Opt-in FAISS shortlist; the HNSW build only pays off when the same large parent set is queried repeatedly
+    ann_enabled: bool = False
+    ann_min_parents: int = 10_000
+    ann_candidate_factor: int = 4
+
+
+def _run_coroutine(coro):
+    """asyncio.run that also works when the caller already has a running loop (e.g. Jupyter)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+DEFAULT_EMBEDDING_CACHE_DIR = Path.home() / ".cache" / "mr400_embed"
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """L2-normalize rows and quantize them to int8 with a per-row float32 scale."""
+    unit = _l2_normalize_rows(vectors)
+    scales = np.abs(unit).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(unit / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def dequantize_int8(quantized: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return quantized.astype(np.float32) * scales[:, None]
+
+
+class DiskEmbeddingCache:
+    """Content-addressed SQLite store of int8-quantized embeddings (one file per model)."""
+
+    _QUERY_CHUNK = 500  # stay well below SQLite's bound-parameter limit
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings_q8 (key TEXT PRIMARY KEY, dim INT, scale REAL, vec BLOB)"
+            )
+
+    @staticmethod
+    def make_key(deployment: str, model: str, text: str) -> str:
+        return hashlib.sha256(f"{deployment}:{model}:{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, np.ndarray]:
+        """Return dequantized float32 vectors for the keys present in the cache."""
+        unique_keys = list(dict.fromkeys(keys))
+        hits: dict[str, np.ndarray] = {}
+        with sqlite3.connect(self.path) as conn:
+            for start in range(0, len(unique_keys), self._QUERY_CHUNK):
+                chunk = unique_keys[start : start + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, dim, scale, vec FROM embeddings_q8 WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, dim, scale, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.int8)
+                    if vec.shape[0] == dim:
+                        hits[key] = vec.astype(np.float32) * np.float32(scale)
+        return hits
+
+    def put_many(self, keys: Sequence[str], quantized: np.ndarray, scales: np.ndarray) -> None:
+        if len(keys) == 0:
+            return
+        rows = [
+            (key, int(vec.shape[0]), float(scale), vec.tobytes())
+            for key, vec, scale in zip(keys, quantized, scales)
+        ]
+        with sqlite3.connect(self.path) as conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings_q8 (key, dim, scale, vec) VALUES (?, ?, ?, ?)", rows)
 
 
 class EmbeddingProvider:
@@ -63,14 +170,55 @@ class EmbeddingProvider:
         use_litellm_proxy: bool = False,
         proxy_base_url: str | None = None,
         proxy_api_key: str | None = None,
+        cache_dir: str | Path | None = None,
+        use_cache: bool = True,
+        batch_size: int = 128,
+        concurrency: int = 8,
+        max_retries: int = 5,
     ) -> None:
         self.azure_config = azure_config
         self.fallback_model_name = fallback_model_name
         self.use_litellm_proxy = use_litellm_proxy
         self.proxy_base_url = proxy_base_url
         self.proxy_api_key = proxy_api_key
+        self.cache_dir = Path(cache_dir or os.getenv("EMBEDDING_CACHE_DIR") or DEFAULT_EMBEDDING_CACHE_DIR)
+        self.use_cache = use_cache
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
         self._sbert: SentenceTransformer | None = None
 
+    def _get_cache(self, model: str) -> DiskEmbeddingCache | None:
+        if not self.use_cache:
+            return None
+        safe_model = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in model)
+        try:
+            return DiskEmbeddingCache(self.cache_dir / f"{safe_model}.sqlite")
+        except (OSError, sqlite3.Error) as exc:
+            # Unwritable cache dir or corrupt file: embed without caching
+            warnings.warn(f"Embedding cache unavailable, continuing without it: {exc}")
+            return None
+
+    @staticmethod
+    def _cache_get(cache: DiskEmbeddingCache | None, keys: Sequence[str]) -> dict[str, np.ndarray]:
+        if cache is None:
+            return {}
+        try:
+            return cache.get_many(keys)
+        except (OSError, sqlite3.Error) as exc:
+            warnings.warn(f"Embedding cache read failed, treating as misses: {exc}")
+            return {}
+
+    @staticmethod
+    def _cache_put(cache: DiskEmbeddingCache | None, keys: Sequence[str], quantized: np.ndarray, scales: np.ndarray) -> None:
+        if cache is None:
+            return
+        try:
+            cache.put_many(keys, quantized, scales)
+        except (OSError, sqlite3.Error) as exc:
+            # e.g. the file is locked by another session's write; the vectors are still returned
+            warnings.warn(f"Embedding cache write failed: {exc}")
+
     def _ensure_sbert(self):
         if not SBERT_AVAILABLE:
             raise RuntimeError(
@@ -83,6 +231,10 @@ class EmbeddingProvider:
 
     def embed(self, texts: Sequence[str], method: Literal["azure", "sbert"] = "azure") -> np.ndarray:
         """Embed texts using OpenAI-compatible endpoint (LiteLLM or direct Azure)."""
+        return _run_coroutine(self.embed_async(texts, method=method))
+
+    async def embed_async(self, texts: Sequence[str], method: Literal["azure", "sbert"] = "azure") -> np.ndarray:
+        """Async variant of embed; API batches are sent concurrently."""
         if method == "azure" and (self.azure_config or self.use_litellm_proxy):
             safe_texts = ["" if t is None else str(t) for t in texts]
             if len(safe_texts) == 0:
@@ -90,45 +242,85 @@ class EmbeddingProvider:
             
             # Simple OpenAI client - exactly like the working Tool_RequirementsTracing app
             if self.use_litellm_proxy and self.proxy_base_url and self.proxy_api_key:
-                client = OpenAI(
+                client = AsyncOpenAI(
                     base_url=self.proxy_base_url,
                     api_key=self.proxy_api_key,
                     timeout=120.0,
                 )
                 model = os.getenv("EMBEDDING_MODEL", "azure-embedding-large")
+                deployment = self.proxy_base_url
             elif self.azure_config:
                 # Direct Azure mode: use OpenAI client with Azure endpoint format
                 # Format: base_url = https://endpoint/openai/deployments/deployment-name
                 azure_base = f"{self.azure_config.endpoint.rstrip('/')}/openai/deployments/{self.azure_config.deployment_name}"
-                client = OpenAI(
+                client = AsyncOpenAI(
                     base_url=azure_base,
                     api_key=self.azure_config.api_key,
                     timeout=120.0,
                     default_headers={"api-version": self.azure_config.api_version},
                 )
                 model = self.azure_config.model_name
+                deployment = self.azure_config.deployment_name
             else:
                 raise RuntimeError(
                     "No embedding provider configured. Set OPENAI_BASE_URL or AZURE_OPENAI_* env vars."
                 )
             
-            # Batch embed (matching working app pattern)
-            batch_size = 256
-            embeddings_list = []
+            # Look up cached vectors first; only misses go to the API
+            cache = self._get_cache(model)
+            keys = [DiskEmbeddingCache.make_key(deployment, model, t) for t in safe_texts]
+            vectors = self._cache_get(cache, keys)
+            miss_texts: dict[str, str] = {}
+            for key, text in zip(keys, safe_texts):
+                if key not in vectors:
+                    miss_texts.setdefault(key, text)
+            
+            # Fixed-size batches sent concurrently, bounded by a semaphore
+            miss_keys = list(miss_texts)
+            key_batches = [miss_keys[start : start + self.batch_size] for start in range(0, len(miss_keys), self.batch_size)]
+            semaphore = asyncio.Semaphore(self.concurrency)
             try:
-                for start in range(0, len(safe_texts), batch_size):
-                    batch = safe_texts[start : start + batch_size]
-                    resp = client.embeddings.create(model=model, input=batch)
-                    for item in resp.data:
-                        embeddings_list.append(item.embedding)
+                async with client:
+                    responses = await asyncio.gather(
+                        *(
+                            self._create_embeddings(client, model, [miss_texts[k] for k in batch_keys], semaphore)
+                            for batch_keys in key_batches
+                        )
+                    )
             except Exception as exc:
                 raise RuntimeError(f"Embedding failed: {exc}") from exc
             
-            return np.asarray(embeddings_list, dtype=np.float32)
-
-        # Fallback to SBERT
+            new_vectors: dict[str, np.ndarray] = {}
+            for batch_keys, resp in zip(key_batches, responses):
+                for key, item in zip(batch_keys, resp.data):
+                    new_vectors[key] = np.asarray(item.embedding, dtype=np.float32)
+            if new_vectors:
+                # Fresh vectors go through the same int8 round trip as cached ones so reruns score identically
+                quantized, scales = quantize_int8(np.stack(list(new_vectors.values())))
+                self._cache_put(cache, list(new_vectors), quantized, scales)
+                vectors.update(zip(new_vectors, dequantize_int8(quantized, scales)))
+            return np.stack([vectors[key] for key in keys])
+
+        # Fallback to SBERT (encode length-sorts inputs internally, so batches pad to similar lengths)
         model = self._ensure_sbert()
-        return model.encode(list(texts), convert_to_numpy=True)
+        return model.encode(
+            list(texts),
+            batch_size=64,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+
+    async def _create_embeddings(self, client: AsyncOpenAI, model: str, batch: list[str], semaphore: asyncio.Semaphore):
+        """Send one embeddings request, backing off exponentially on 429s."""
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await client.embeddings.create(model=model, input=batch)
+                except RateLimitError:
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
 
 
 def load_excel(file_path: str | Path, child_sheet: str, parent_sheet: str) -> tuple[pd.DataFrame, pd.DataFrame]:
@@ -145,6 +337,21 @@ def preprocess_text(text: str, stop_phrases: Sequence[str] = DEFAULT_STOP_PHRASE
     return " ".join(lowered.split())
 
 
+@lru_cache(maxsize=8)
+def _stop_phrase_pattern(stop_phrases: tuple[str, ...]) -> re.Pattern | None:
+    phrases = sorted({p.lower() for p in stop_phrases if p}, key=len, reverse=True)
+    return re.compile("|".join(re.escape(p) for p in phrases)) if phrases else None
+
+
+def preprocess_series(texts: pd.Series, stop_phrases: Sequence[str] = DEFAULT_STOP_PHRASES) -> pd.Series:
+    """Column-wise preprocess_text: one vectorized pass per step instead of a Python call per row."""
+    lowered = texts.fillna("").astype(str).str.lower()
+    pattern = _stop_phrase_pattern(tuple(stop_phrases))
+    if pattern is not None:
+        lowered = lowered.str.replace(pattern, " ", regex=True)
+    return lowered.str.replace(r"\s+", " ", regex=True).str.strip()
+
+
 def load_lexicon(path: str | Path) -> dict[str, list[str]]:
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
@@ -152,6 +359,7 @@ def load_lexicon(path: str | Path) -> dict[str, list[str]]:
 
 
 def compute_rule_score(child_text: str, parent_text: str, lexicon: dict[str, list[str]]):
+    """Scalar reference for a single pair; rank_top_k uses the vectorized compute_rule_hits."""
     child_tokens = preprocess_text(child_text).split()
     parent_tokens = preprocess_text(parent_text).split()
     child_set = set(child_tokens)
@@ -161,35 +369,108 @@ def compute_rule_score(child_text: str, parent_text: str, lexicon: dict[str, lis
         if any(keyword in child_set for keyword in keywords) and any(keyword in parent_set for keyword in keywords):
             matched_groups.append(group)
     if matched_groups:
-        return 0.85, matched_groups
+        return RULE_SCORE, matched_groups
     return None, matched_groups
 
 
+def _l2_normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Return a C-contiguous float32 copy of ``vectors`` with unit-length rows."""
+    out = np.array(vectors, dtype=np.float32, order="C", copy=True)
+    norms = np.einsum("ij,ij->i", out, out)
+    np.sqrt(norms, out=norms)
+    np.maximum(norms, 1e-12, out=norms)
+    out /= norms[:, None]
+    return out
+
+
 def compute_embedding_similarity(
     child_embeddings: np.ndarray,
     parent_embeddings: np.ndarray,
 ) -> np.ndarray:
     if child_embeddings.size == 0 or parent_embeddings.size == 0:
-        return np.zeros((child_embeddings.shape[0], parent_embeddings.shape[0]))
-    child_norm = child_embeddings / np.linalg.norm(child_embeddings, axis=1, keepdims=True)
-    parent_norm = parent_embeddings / np.linalg.norm(parent_embeddings, axis=1, keepdims=True)
-    return child_norm @ parent_norm.T
+        return np.zeros((child_embeddings.shape[0], parent_embeddings.shape[0]), dtype=np.float32)
+    # Single SGEMM on contiguous float32 buffers
+    return _l2_normalize_rows(child_embeddings) @ _l2_normalize_rows(parent_embeddings).T
 
 
-def compute_tfidf_similarity(child_texts: Sequence[str], parent_texts: Sequence[str], config: MatchingConfig) -> np.ndarray:
-    corpus = list(child_texts) + list(parent_texts)
-    vectorizer = TfidfVectorizer(
-        ngram_range=config.ngram_range,
-        stop_words="english",
-        max_features=config.lexical_max_features,
+@lru_cache(maxsize=4)
+def fit_parent_tfidf(
+    parent_texts: tuple[str, ...], ngram_range: tuple[int, int], n_features: int
+) -> tuple[Pipeline, sparse.csr_matrix]:
+    """
+    Fit TF-IDF on the parent corpus and return (vectorizer, L2-normalized parent rows).
+    Memoized so reruns against an unchanged parent sheet skip the fit entirely.
+    """
+    # Stateless hashing keeps fit cost flat; no vocabulary is built
+    vectorizer = make_pipeline(
+        HashingVectorizer(
+            n_features=n_features,
+            ngram_range=ngram_range,
+            stop_words="english",
+            alternate_sign=False,
+            norm=None,
+        ),
+        TfidfTransformer(sublinear_tf=True, norm="l2"),
+    )
+    parent_matrix = vectorizer.fit_transform(list(parent_texts)).tocsr()
+    return vectorizer, parent_matrix
+
+
+def compute_tfidf_vectors(
+    child_texts: Sequence[str], parent_texts: Sequence[str], config: MatchingConfig
+) -> tuple[sparse.csr_matrix, sparse.csr_matrix]:
+    """Return L2-normalized TF-IDF rows for children and parents, weighted by the parent corpus."""
+    vectorizer, parent_matrix = fit_parent_tfidf(
+        tuple(parent_texts), tuple(config.ngram_range), config.lexical_hash_features
     )
-    tfidf_matrix = vectorizer.fit_transform(corpus)
-    child_matrix = tfidf_matrix[: len(child_texts)]
-    parent_matrix = tfidf_matrix[len(child_texts) :]
-    return cosine_similarity(child_matrix, parent_matrix)
+    return vectorizer.transform(list(child_texts)).tocsr(), parent_matrix
+
+
+def compute_tfidf_similarity(child_texts: Sequence[str], parent_texts: Sequence[str], config: MatchingConfig) -> np.ndarray:
+    child_matrix, parent_matrix = compute_tfidf_vectors(child_texts, parent_texts, config)
+    # Rows are already unit length, so the sparse product is the cosine similarity
+    return (child_matrix @ parent_matrix.T).toarray()
+
+
+_ANN_INDEX_CACHE: OrderedDict[str, object] = OrderedDict()
+_ANN_INDEX_CACHE_SIZE = 2
+_ANN_INDEX_LOCK = threading.Lock()
+_RULE_CHUNK_ROWS = 1024
+
+
+def _get_parent_index(parent_unit: np.ndarray):
+    """Build (or reuse) an HNSW inner-product index over the parent vectors, keyed by their content."""
+    key = hashlib.sha256(np.ascontiguousarray(parent_unit).tobytes()).hexdigest() + f":{parent_unit.shape}"
+    with _ANN_INDEX_LOCK:
+        index = _ANN_INDEX_CACHE.get(key)
+        if index is not None:
+            _ANN_INDEX_CACHE.move_to_end(key)
+            return index
+    index = faiss.IndexHNSWFlat(parent_unit.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = 80
+    index.add(parent_unit)
+    with _ANN_INDEX_LOCK:
+        _ANN_INDEX_CACHE[key] = index
+        while len(_ANN_INDEX_CACHE) > _ANN_INDEX_CACHE_SIZE:
+            _ANN_INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def search_parent_candidates(
+    child_unit: np.ndarray, parent_unit: np.ndarray, n_candidates: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Approximate inner-product search of unit-length child vectors over parents (FAISS HNSW).
+    The index is memoized per parent set, so reruns against an unchanged parent sheet skip the build.
+    Returns (scores, parent indices), each [n_children, n_candidates]; missing hits are -1.
+    """
+    index = _get_parent_index(parent_unit)
+    params = faiss.SearchParametersHNSW(efSearch=max(64, n_candidates))
+    return index.search(child_unit, min(n_candidates, parent_unit.shape[0]), params=params)
 
 
 def compute_fusion_score(rule_score, embed_score, tfidf_score):
+    """Scalar reference for a single pair; rank_top_k applies the same rule via fuse_top_k."""
     if rule_score is not None:
         computed = max(rule_score, embed_score, tfidf_score)
         method = "Fusion"
@@ -203,6 +484,172 @@ def compute_fusion_score(rule_score, embed_score, tfidf_score):
     return computed, method
 
 
+def compute_rule_hits(texts: Sequence[str], lexicon: dict[str, list[str]]) -> sparse.csr_matrix:
+    """
+    Sparse [n_texts, n_groups] indicator marking which lexicon groups each text hits.
+    Texts are expected to be preprocessed already; tokens are matched like compute_rule_score.
+    """
+    keyword_groups: dict[str, list[int]] = {}
+    for group_idx, keywords in enumerate(lexicon.values()):
+        for keyword in keywords:
+            keyword_groups.setdefault(keyword, []).append(group_idx)
+
+    doc_rows, group_cols = [], []
+    for doc_idx, text in enumerate(texts):
+        groups = {g for token in set(text.split()) for g in keyword_groups.get(token, ())}
+        doc_rows.extend([doc_idx] * len(groups))
+        group_cols.extend(groups)
+    return sparse.csr_matrix(
+        (np.ones(len(doc_rows), dtype=np.int32), (doc_rows, group_cols)),
+        shape=(len(texts), len(lexicon)),
+    )
+
+
+def _add_rule_candidates(
+    candidates: np.ndarray,
+    valid: np.ndarray,
+    cand_embed: np.ndarray,
+    child_hits: sparse.csr_matrix,
+    parent_hits: sparse.csr_matrix,
+    child_unit: np.ndarray,
+    parent_unit: np.ndarray,
+    child_tfidf: sparse.csr_matrix,
+    parent_tfidf: sparse.csr_matrix,
+    parent_inv: np.ndarray,
+    k: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Append up to ``k`` rule-hit parent rows per child that the ANN shortlist missed, as extra
+    candidate columns masked through ``valid``, with their exact embedding scores.
+    Every rule hit fuses to at least RULE_SCORE, so at most ``k`` of them can reach a child's
+    top-K; the extras are chosen by exact fusion (earlier parent row first on ties).
+    ``parent_hits`` is per parent row; ``parent_tfidf`` is per distinct parent (see ``parent_inv``).
+    """
+    n_rows = candidates.shape[0]
+    extra_idx = np.zeros((n_rows, k), dtype=candidates.dtype)
+    extra_valid = np.zeros((n_rows, k), dtype=bool)
+    extra_embed = np.zeros((n_rows, k), dtype=np.float32)
+    group_parents = parent_hits.T.tocsr()
+    hit_children = np.flatnonzero(np.diff(child_hits.indptr))
+    # Rule-hit pairs are expanded a chunk of children at a time so they never exist for all children at once
+    for start in range(0, len(hit_children), _RULE_CHUNK_ROWS):
+        rows = hit_children[start : start + _RULE_CHUNK_ROWS]
+        rule_pairs = (child_hits[rows] @ group_parents).tocsr()
+        rule_pairs.sort_indices()
+        for row, lo, hi in zip(rows, rule_pairs.indptr[:-1], rule_pairs.indptr[1:]):
+            missing = np.setdiff1d(rule_pairs.indices[lo:hi], candidates[row, valid[row]])
+            if missing.size == 0:
+                continue
+            embed = np.concatenate(
+                [parent_unit[block] @ child_unit[row] for block in np.array_split(missing, -(-missing.size // 4096))]
+            )
+            tfidf = (parent_tfidf[parent_inv[missing]] @ child_tfidf[row].T).toarray().ravel()
+            fusion = np.maximum(np.maximum(embed, tfidf), RULE_SCORE)
+            keep = np.argsort(-fusion, kind="stable")[:k]
+            extra_idx[row, : keep.size] = missing[keep]
+            extra_valid[row, : keep.size] = True
+            extra_embed[row, : keep.size] = embed[keep]
+    n_extra = int(extra_valid.sum(axis=1).max(initial=0))
+    if n_extra == 0:
+        return candidates, valid, cand_embed
+    return (
+        np.hstack([candidates, extra_idx[:, :n_extra]]),
+        np.hstack([valid, extra_valid[:, :n_extra]]),
+        np.hstack([cand_embed, extra_embed[:, :n_extra]]),
+    )
+
+
+def _top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k largest scores in each row, best first; ties keep the earlier column."""
+    n_rows, n_cols = scores.shape
+    k = min(k, n_cols)
+    if k == 0:
+        return np.zeros((n_rows, 0), dtype=np.intp)
+    if k < n_cols:
+        # argpartition breaks ties arbitrarily, so take everything above the k-th largest score and
+        # fill the remaining slots with the leftmost columns equal to it
+        kth = np.partition(scores, n_cols - k, axis=1)[:, n_cols - k, None]
+        above = scores > kth
+        at_kth = scores == kth
+        need = k - above.sum(axis=1, keepdims=True)
+        take = above | (at_kth & (np.cumsum(at_kth, axis=1) <= need))
+        top = np.nonzero(take)[1].reshape(n_rows, k)
+    else:
+        top = np.tile(np.arange(n_cols), (n_rows, 1))
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+_FUSE_KERNEL_LOCK = threading.Lock()
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _fuse_top_k_kernel(embed, tfidf, rule, valid, use_valid, k, out_idx, out_score):
+        # One pass per child: fuse each candidate score and insert it into a sorted top-K buffer
+        for i in prange(embed.shape[0]):
+            filled = 0
+            for j in range(embed.shape[1]):
+                if use_valid and not valid[i, j]:
+                    continue
+                f = max(embed[i, j], tfidf[i, j])
+                if rule[i, j] and f < RULE_SCORE:
+                    f = RULE_SCORE
+                if filled == k and f <= out_score[i, k - 1]:
+                    continue
+                # Ties keep the earlier candidate ahead
+                pos = min(filled, k - 1)
+                while pos > 0 and out_score[i, pos - 1] < f:
+                    out_score[i, pos] = out_score[i, pos - 1]
+                    out_idx[i, pos] = out_idx[i, pos - 1]
+                    pos -= 1
+                out_score[i, pos] = f
+                out_idx[i, pos] = j
+                if filled < k:
+                    filled += 1
+
+
+def fuse_top_k(
+    embed: np.ndarray, tfidf: np.ndarray, rule: np.ndarray, valid: np.ndarray | None, k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse candidate scores and select the top-K per row, best first.
+    ``valid`` masks out padding candidates; None means every column is a real candidate.
+    Returns (column indices, fused scores), each [n_rows, k]; unfilled slots have index -1.
+    Uses a fused Numba kernel when available so the full fusion matrix is never materialized.
+    """
+    n_rows, n_cols = embed.shape
+    k = min(k, n_cols)
+    if k == 0:
+        return np.zeros((n_rows, 0), dtype=np.intp), np.zeros((n_rows, 0))
+    if NUMBA_AVAILABLE:
+        top_idx = np.full((n_rows, k), -1, dtype=np.intp)
+        top_score = np.full((n_rows, k), -np.inf)
+        use_valid = valid is not None
+        valid_arr = valid if use_valid else np.empty((0, 0), dtype=bool)
+        # Numba's default workqueue threading layer aborts the process on concurrent parallel
+        # calls, and Streamlit runs each session on its own thread
+        with _FUSE_KERNEL_LOCK:
+            _fuse_top_k_kernel(embed, tfidf, rule, valid_arr, use_valid, k, top_idx, top_score)
+        return top_idx, top_score
+
+    fusion = np.maximum(embed, tfidf)
+    fusion = np.where(rule, np.maximum(fusion, RULE_SCORE), fusion)
+    if valid is not None:
+        fusion[~valid] = -np.inf
+    top_idx = _top_k_indices(fusion, k)
+    top_score = np.take_along_axis(fusion, top_idx, axis=1)
+    if valid is not None:
+        top_idx[~np.take_along_axis(valid, top_idx, axis=1)] = -1
+    return top_idx, top_score
+
+
+async def _embed_pair(emb_provider: EmbeddingProvider, child_texts: Sequence[str], parent_texts: Sequence[str]):
+    return await asyncio.gather(
+        emb_provider.embed_async(child_texts, method="azure"),
+        emb_provider.embed_async(parent_texts, method="azure"),
+    )
+
+
 def rank_top_k(
     children_df: pd.DataFrame,
     parents_df: pd.DataFrame,
@@ -218,98 +665,129 @@ def rank_top_k(
     extra_child_cols = extra_child_cols or []
     extra_parent_cols = extra_parent_cols or []
     
+    if children_df.empty:
+        raise ValueError("Child sheet has no rows; select a sheet with the requirements to trace.")
+    if parents_df.empty:
+        raise ValueError("Parent sheet has no rows; select a sheet with canonical requirements to match against.")
+    
     lexicon = load_lexicon(config.lexicon_path)
+    group_names = np.array(list(lexicon.keys()), dtype=object)
     
     # Preprocess for matching
-    child_texts = children_df["Child_Text"].fillna("").astype(str).map(preprocess_text)
-    parent_texts = parents_df["Parent_Text"].fillna("").astype(str).map(preprocess_text)
-
-    # Batch embeddings
-    child_emb = emb_provider.embed(child_texts, method="azure")
-    parent_emb = emb_provider.embed(parent_texts, method="azure")
-    embed_matrix = compute_embedding_similarity(child_emb, parent_emb)
-    tfidf_matrix = compute_tfidf_similarity(child_texts, parent_texts, config)
-
-    rows = []
-    for child_idx, child_row in children_df.iterrows():
-        # Handle empty child text
-        if not child_row["Child_Text"] or str(child_row["Child_Text"]).strip() == "":
-            # Placeholder row for empty children
-            row = {
-                "Child_ID": child_row["Child_ID"],
-                "Child_Text": "",
-                "Parent_ID": "",
-                "Parent_Text": "",
-                "Score_Rule": 0.0,
-                "Score_Embedding": 0.0,
-                "Score_TFIDF": 0.0,
-                "Computed_Score": 0.0,
-                "Method_Used": "N/A",
-                "Matched_Groups": "",
-            }
-            for col in extra_child_cols:
-                row[f"Child_{col}"] = child_row.get(col, "")
-            for col in extra_parent_cols:
-                row[f"Parent_{col}"] = ""
-            rows.append(row)
-            continue
-            
-        embed_scores = embed_matrix[child_idx]
-        tfidf_scores = tfidf_matrix[child_idx]
-        
-        # Get top-K by fusion score instead of just embedding
-        fusion_scores = []
-        for parent_idx in range(len(parents_df)):
-            parent_row = parents_df.iloc[parent_idx]
-            rule_score, _ = (None, [])
-            if config.rules_enabled:
-                rule_score, _ = compute_rule_score(
-                    child_row["Child_Text"], parent_row["Parent_Text"], lexicon
-                )
-            fusion_score, _ = compute_fusion_score(
-                rule_score,
-                float(embed_scores[parent_idx]),
-                float(tfidf_scores[parent_idx]),
-            )
-            fusion_scores.append(fusion_score)
-        
-        best_parent_indices = np.argsort(-np.array(fusion_scores))[: config.top_k]
-        
-        for parent_idx in best_parent_indices:
-            parent_row = parents_df.iloc[parent_idx]
-            rule_score, matched_groups = (None, [])
-            if config.rules_enabled:
-                rule_score, matched_groups = compute_rule_score(
-                    child_row["Child_Text"], parent_row["Parent_Text"], lexicon
-                )
-            fusion_score, method = compute_fusion_score(
-                rule_score,
-                float(embed_scores[parent_idx]),
-                float(tfidf_scores[parent_idx]),
-            )
-            
-            row = {
-                "Child_ID": child_row["Child_ID"],
-                "Child_Text": child_row["Child_Text"],
-                "Parent_ID": parent_row["Parent_ID"],
-                "Parent_Text": parent_row["Parent_Text"],
-                "Score_Rule": rule_score if rule_score is not None else 0.0,
-                "Score_Embedding": float(embed_scores[parent_idx]),
-                "Score_TFIDF": float(tfidf_scores[parent_idx]),
-                "Computed_Score": fusion_score,
-                "Method_Used": method,
-                "Matched_Groups": ", ".join(matched_groups),
-            }
-            
-            # Add extra columns
-            for col in extra_child_cols:
-                row[f"Child_{col}"] = child_row.get(col, "")
-            for col in extra_parent_cols:
-                row[f"Parent_{col}"] = parent_row.get(col, "")
-                
-            rows.append(row)
+    child_texts = preprocess_series(children_df["Child_Text"])
+    parent_texts = preprocess_series(parents_df["Parent_Text"])
+
+    # Score each distinct text once, then scatter back to rows via the inverse index
+    child_uniq, child_inv = np.unique(child_texts.to_numpy(dtype=object), return_inverse=True)
+    parent_uniq, parent_inv = np.unique(parent_texts.to_numpy(dtype=object), return_inverse=True)
+
+    # Batch embeddings (children and parents requested concurrently)
+    child_emb, parent_emb = _run_coroutine(_embed_pair(emb_provider, child_uniq, parent_uniq))
+
+    # Rule hits: a pair fires when child and parent share at least one lexicon group
+    n_children, n_parents = len(children_df), len(parents_df)
+    if config.rules_enabled:
+        child_hits = compute_rule_hits(child_uniq, lexicon)
+        parent_hits = compute_rule_hits(parent_uniq, lexicon)
+    else:
+        child_hits = sparse.csr_matrix((len(child_uniq), len(lexicon)), dtype=np.int32)
+        parent_hits = sparse.csr_matrix((len(parent_uniq), len(lexicon)), dtype=np.int32)
+
+    # Candidate parent rows per distinct child: an ANN shortlist for large parent sets, otherwise
+    # every parent row (candidates/valid stay None and candidate positions are parent rows)
+    use_ann = config.ann_enabled and FAISS_AVAILABLE and n_parents >= config.ann_min_parents and child_emb.size > 0
+    if use_ann:
+        child_unit = _l2_normalize_rows(child_emb)
+        parent_unit = _l2_normalize_rows(parent_emb)[parent_inv]
+        cand_embed, candidates = search_parent_candidates(
+            child_unit, parent_unit, config.top_k * config.ann_candidate_factor
+        )
+        valid = candidates >= 0
+        candidates = np.where(valid, candidates, 0)
+        child_tfidf, parent_tfidf = compute_tfidf_vectors(child_uniq, parent_uniq, config)
+        # Rule hits lift a pair to RULE_SCORE regardless of embedding, so they must never be shortlisted away
+        candidates, valid, cand_embed = _add_rule_candidates(
+            candidates, valid, cand_embed, child_hits, parent_hits[parent_inv], child_unit, parent_unit,
+            child_tfidf, parent_tfidf, parent_inv, config.top_k,
+        )
+        # TF-IDF and rules are only scored on the shortlisted pairs
+        cand_rows = np.repeat(np.arange(len(child_uniq)), candidates.shape[1])
+        cand_cols = parent_inv[candidates.ravel()]
+        cand_tfidf = np.asarray(child_tfidf[cand_rows].multiply(parent_tfidf[cand_cols]).sum(axis=1)).reshape(candidates.shape)
+        cand_rule = np.asarray(child_hits[cand_rows].multiply(parent_hits[cand_cols]).sum(axis=1)).reshape(candidates.shape) > 0
+    else:
+        candidates = valid = None
+        cand_embed = compute_embedding_similarity(child_emb, parent_emb)[:, parent_inv]
+        cand_tfidf = compute_tfidf_similarity(child_uniq, parent_uniq, config)[:, parent_inv]
+        cand_rule = (child_hits @ parent_hits.T).toarray()[:, parent_inv] > 0
+
+    # Fusion over the candidates, then top-K per child
+    top_pos, top_fusion = fuse_top_k(cand_embed, cand_tfidf, cand_rule, valid, config.top_k)
+    k = top_pos.shape[1]
+
+    # Empty children emit a single placeholder row; every other child emits its top-K
+    raw_child_texts = children_df["Child_Text"]
+    empty = (raw_child_texts.isna() | (raw_child_texts.astype(str).str.strip() == "")).to_numpy()
+    slots = np.zeros((n_children, max(k, 1)), dtype=bool)
+    slots[~empty, :k] = (top_pos >= 0)[child_inv[~empty]]
+    slots[empty, 0] = True
+    child_rows, slot_cols = np.nonzero(slots)
+    n_rows = len(child_rows)
+    matched = ~empty[child_rows]
+    pair_children = child_rows[matched]
+    pair_uniq = child_inv[pair_children]
+    pair_slots = slot_cols[matched]
+    pair_cand = top_pos[pair_uniq, pair_slots]
+    pair_parents = pair_cand if candidates is None else candidates[pair_uniq, pair_cand]
+
+    def scatter(values: np.ndarray, fill) -> np.ndarray:
+        out = np.full(n_rows, fill, dtype=object if isinstance(fill, str) else np.float32)
+        out[matched] = values
+        return out
+
+    embed_scores = scatter(cand_embed[pair_uniq, pair_cand], 0.0)
+    tfidf_scores = scatter(cand_tfidf[pair_uniq, pair_cand], 0.0)
+    rule_hit = np.zeros(n_rows, dtype=bool)
+    rule_hit[matched] = cand_rule[pair_uniq, pair_cand]
+    computed = scatter(top_fusion[pair_uniq, pair_slots], 0.0)
+    method_codes = np.select(
+        [~matched, rule_hit, embed_scores >= tfidf_scores],
+        [METHOD_NA, METHOD_FUSION, METHOD_SBERT],
+        default=METHOD_TFIDF,
+    ).astype(np.uint8)
+    method = pd.Categorical.from_codes(method_codes, categories=METHOD_LABELS)
+    # Group names are only resolved for the emitted pairs
+    shared_groups = child_hits[pair_uniq].multiply(parent_hits[parent_inv[pair_parents]]).tocsr()
+    shared_groups.sort_indices()
+    matched_groups = scatter(
+        np.array(
+            [", ".join(group_names[shared_groups.indices[lo:hi]]) for lo, hi in zip(shared_groups.indptr[:-1], shared_groups.indptr[1:])],
+            dtype=object,
+        ),
+        "",
+    )
+
+    columns = {
+        "Child_ID": children_df["Child_ID"].to_numpy()[child_rows],
+        "Child_Text": scatter(raw_child_texts.to_numpy()[pair_children], ""),
+        "Parent_ID": scatter(parents_df["Parent_ID"].to_numpy()[pair_parents], ""),
+        "Parent_Text": scatter(parents_df["Parent_Text"].to_numpy()[pair_parents], ""),
+        "Score_Rule": np.where(rule_hit, RULE_SCORE, 0.0).astype(np.float32),
+        "Score_Embedding": embed_scores,
+        "Score_TFIDF": tfidf_scores,
+        "Computed_Score": computed,
+        "Method_Used": method,
+        "Matched_Groups": matched_groups,
+    }
+    for col in extra_child_cols:
+        values = children_df[col].to_numpy() if col in children_df.columns else np.full(n_children, "", dtype=object)
+        columns[f"Child_{col}"] = values[child_rows]
+    for col in extra_parent_cols:
+        values = parents_df[col].to_numpy() if col in parents_df.columns else np.full(n_parents, "", dtype=object)
+        columns[f"Parent_{col}"] = scatter(values[pair_parents], "")
             
-    return pd.DataFrame(rows)
+    # Columns are freshly gathered arrays, so pandas can adopt them without copying
+    return pd.DataFrame(columns, copy=False)
 
 
 def validate_trace_coverage(results_df: pd.DataFrame, children_df: pd.DataFrame, parents_df: pd.DataFrame, min_score_threshold: float = 0.5):
@@ -327,34 +805,69 @@ def validate_trace_coverage(results_df: pd.DataFrame, children_df: pd.DataFrame,
         "total_traces": len(results_df),
     }
     
-    # Find children with all scores below threshold
-    for child_id in children_df["Child_ID"].unique():
-        child_traces = results_df[results_df["Child_ID"] == child_id]
-        if child_traces.empty or child_traces["Computed_Score"].max() < min_score_threshold:
-            validation["orphan_children"].append(child_id)
+    # Find children with all scores below threshold (or no traces at all)
+    max_scores = results_df.groupby("Child_ID", sort=False)["Computed_Score"].max()
+    child_ids = pd.Index(children_df["Child_ID"].unique())
+    child_best = max_scores.reindex(child_ids)
+    orphan_mask = child_best.isna() | (child_best < min_score_threshold)
+    validation["orphan_children"] = child_ids[orphan_mask.to_numpy()].tolist()
     
     # Find parents with no children mapped
-    mapped_parents = set(results_df["Parent_ID"].unique())
-    all_parents = set(parents_df["Parent_ID"].unique())
-    validation["childless_parents"] = list(all_parents - mapped_parents)
+    all_parents = pd.Series(parents_df["Parent_ID"].unique())
+    validation["childless_parents"] = all_parents[~all_parents.isin(results_df["Parent_ID"])].tolist()
     
     return validation
 
 
+def _float32_to_shortest(output_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Widen float32 columns to float64 via their shortest decimal form, so Excel stores 0.85
+    rather than 0.8500000238418579.
+    """
+    float32_cols = [col for col in output_df.columns if output_df[col].dtype == np.float32]
+    if not float32_cols:
+        return output_df
+    return output_df.assign(**{col: output_df[col].to_numpy().astype(str).astype(np.float64) for col in float32_cols})
+
+
+def _stream_xlsx(output_df: pd.DataFrame, target, sheet_name: str) -> None:
+    """
+    Write a DataFrame row by row with xlsxwriter in constant-memory mode.
+    pandas' to_excel emits cells column by column, which constant_memory silently drops,
+    so rows are written here directly.
+    """
+    workbook = xlsxwriter.Workbook(
+        target,
+        {
+            "constant_memory": True,
+            "strings_to_urls": False,
+            "default_date_format": "yyyy-mm-dd hh:mm:ss",
+            "remove_timezone": True,
+        },
+    )
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    worksheet.write_row(0, 0, [str(col) for col in output_df.columns], header_format)
+    values = _float32_to_shortest(output_df).astype(object).where(output_df.notna(), None)
+    for row_idx, row in enumerate(values.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_idx, 0, row)
+    workbook.close()
+
+
 def write_to_excel(output_df: pd.DataFrame, file_path: str | Path, sheet_name: str = "Trace_Matrix_Scores") -> None:
     """Write DataFrame to Excel with proper sheet naming."""
     file_path = Path(file_path)
-    mode = "a" if file_path.exists() else "w"
-    with pd.ExcelWriter(file_path, engine="openpyxl", mode=mode, if_sheet_exists="replace") as writer:
-        output_df.to_excel(writer, sheet_name=sheet_name, index=False)
+    if not file_path.exists():
+        _stream_xlsx(output_df, str(file_path), sheet_name)
+        return
+    # xlsxwriter cannot edit existing workbooks; replace the sheet in place with openpyxl
+    with pd.ExcelWriter(file_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+        _float32_to_shortest(output_df).to_excel(writer, sheet_name=sheet_name, index=False)
 
 
 def results_to_excel_bytes(output_df: pd.DataFrame, sheet_name: str = "Trace_Matrix_Scores") -> bytes:
     """Convert DataFrame to Excel bytes for Streamlit download."""
     import io
     buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        output_df.to_excel(writer, sheet_name=sheet_name, index=False)
+    _stream_xlsx(output_df, buffer, sheet_name)
     return buffer.getvalue()
-
-